@@ -42,6 +42,10 @@ setTimeout(() => {
 let serviceReady = false;
 let pendingResponses = new Map();
 let responseBuffers = new Map(); // Store accumulated response lines
+let pendingStatsRequests = []; // Resolvers waiting for a STATS: line
+
+// How long a query may take before it is rejected (the RAG service uses this as its default SLO)
+const QUERY_TIMEOUT_MS = 60000;
 
 // Listen for stdout data from the service
 ragService.stdout.on("data", (data) => {
@@ -99,6 +103,17 @@ ragService.stdout.on("data", (data) => {
         }
       }
     }
+    // Parse routing stats messages (format: "STATS:json")
+    else if (line.startsWith("STATS:")) {
+      const statsRequest = pendingStatsRequests.shift();
+      if (statsRequest) {
+        try {
+          statsRequest.resolve(JSON.parse(line.substring("STATS:".length)));
+        } catch (error) {
+          statsRequest.reject(`Invalid routing stats: ${error}`);
+        }
+      }
+    }
     // Check if this is a continuation line for an existing response
     else {
       // Try to find which request this continuation belongs to
@@ -137,12 +152,19 @@ ragService.on("close", (code) => {
 });
 
 // Send queries to the long-running RAG service process
-async function queryRag(endpoint, question) {
+async function queryRag(endpoint, question, latencySloMs) {
   return new Promise((resolve, reject) => {
     // Create a unique identifier for this request that includes the endpoint
+    // and routing hints (format: endpoint|uniqueId|sent=epochMs,slo=ms).
+    // The send time lets the RAG service subtract the time spent queued from the SLO.
+    const sentAt = Date.now();
     const uniqueId =
-      Date.now().toString() + Math.random().toString(36).substring(2, 10);
-    const requestId = `${endpoint}|${uniqueId}`;
+      sentAt.toString() + Math.random().toString(36).substring(2, 10);
+    const options = [`sent=${sentAt}`];
+    if (latencySloMs !== undefined) {
+      options.push(`slo=${latencySloMs}`);
+    }
+    const requestId = `${endpoint}|${uniqueId}|${options.join(",")}`;
     console.log(`Creating new request with ID: ${requestId}`);
 
     // Store the promise callbacks
@@ -158,9 +180,9 @@ async function queryRag(endpoint, question) {
           clearTimeout(pendingResponses.get(`timeout-${uniqueId}`));
           pendingResponses.delete(`timeout-${uniqueId}`);
         }
-        reject("Query timed out after 60 seconds");
+        reject(`Query timed out after ${QUERY_TIMEOUT_MS / 1000} seconds`);
       }
-    }, 60000);
+    }, QUERY_TIMEOUT_MS);
 
     // Send the query to the RAG service
     // Format: "QUERY:requestId:question"
@@ -190,10 +212,21 @@ async function handleEndpointQuery(req, res, endpointConfig) {
     });
   }
 
-  const { question } = req.body;
+  const { question, latencySloMs } = req.body;
   if (!question) {
     return res.status(400).json({ error: "Question is required" });
   }
+  const hasSlo = latencySloMs !== undefined && latencySloMs !== null;
+  if (
+    hasSlo &&
+    (typeof latencySloMs === "boolean" ||
+      !Number.isFinite(Number(latencySloMs)) ||
+      Number(latencySloMs) <= 0)
+  ) {
+    return res
+      .status(400)
+      .json({ error: "latencySloMs must be a positive number" });
+  }
 
   try {
     // Add the endpoint-specific blurb to the user's question
@@ -201,7 +234,11 @@ async function handleEndpointQuery(req, res, endpointConfig) {
 
     // Query the RAG service with the specific endpoint
     const startTime = Date.now();
-    const response = await queryRag(endpointConfig.endpoint, enhancedQuestion);
+    const response = await queryRag(
+      endpointConfig.endpoint,
+      enhancedQuestion,
+      hasSlo ? Math.ceil(Number(latencySloMs)) : undefined
+    );
     const processingTime = Date.now() - startTime;
 
     res.json({
@@ -234,6 +271,39 @@ app.get("/api/health", (req, res) => {
   });
 });
 
+// Ask the RAG service for its model routing decisions and per-model latency stats
+function getRoutingStats() {
+  return new Promise((resolve, reject) => {
+    const statsRequest = { resolve, reject };
+    pendingStatsRequests.push(statsRequest);
+
+    // The service answers after any queries already queued ahead of this
+    setTimeout(() => {
+      const index = pendingStatsRequests.indexOf(statsRequest);
+      if (index !== -1) {
+        pendingStatsRequests.splice(index, 1);
+        reject("Routing stats request timed out");
+      }
+    }, QUERY_TIMEOUT_MS);
+
+    ragService.stdin.write("STATS:\n");
+  });
+}
+
+app.get("/api/routing-stats", async (req, res) => {
+  if (!serviceReady) {
+    return res.status(503).json({
+      error: "RAG service is still initializing. Please try again in a moment.",
+    });
+  }
+
+  try {
+    res.json(await getRoutingStats());
+  } catch (error) {
+    res.status(500).json({ error: error.toString() });
+  }
+});
+
 // Register a route that lists all available endpoints
 app.get("/api/endpoints", (req, res) => {
   const availableEndpoints = Object.values(ENDPOINTS).map((endpoint) => ({
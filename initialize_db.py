@@ -6,6 +6,7 @@ import os
 from rag_local import (
     load_documents,
     split_documents,
+    deduplicate_chunks,
     get_embedding_function,
     index_documents
 )
@@ -39,6 +40,9 @@ try:
     
     # Split documents
     chunks = split_documents(docs)
+
+    # Drop exact and near-duplicate chunks
+    chunks, _ = deduplicate_chunks(chunks)
     
     # Index documents
     vector_store = index_documents(chunks, embedding_function)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Model router - Picks the small (phi3:mini) or large (qwen3:14b) RAG chain for each request
+"""
+import sys
+import time
+from collections import deque
+from count_tokens import count_tokens_rough
+
+# Model profiles, matching the defaults of the two chains in rag_local.py
+SMALL_MODEL = {"name": "phi3:mini", "context_window": 4096, "chunks": 3}
+LARGE_MODEL = {"name": "qwen3:14b", "context_window": 16384, "chunks": 5}
+
+CHUNK_TOKENS = 500 // 4        # split_documents uses 500-character chunks
+TEMPLATE_TOKENS = 50           # Prompt template overhead
+ANSWER_TOKEN_RESERVE = 1024    # Room left in the context window for the answer
+MAX_QUEUE_FOR_LARGE = 1        # More requests waiting behind this one sends it to the small model
+REQUEST_TIMEOUT_MS = 60000     # Matches QUERY_TIMEOUT_MS in app.js; used as the SLO when the caller sends none
+LATENCY_SAMPLES = 100          # Recent latencies kept per model
+
+# Latency guesses (ms) used until a model has served a few requests
+DEFAULT_LATENCY_MS = {SMALL_MODEL["name"]: 8000, LARGE_MODEL["name"]: 30000}
+
+# How the load and SLO checks interact: with the default latencies, a request
+# that waited behind one qwen3:14b call (~30 s) still has time for phi3:mini
+# (~8 s) inside REQUEST_TIMEOUT_MS but not for another qwen3:14b call, so the
+# SLO check sends it to phi3:mini. MAX_QUEUE_FOR_LARGE keeps a longer backlog
+# from building up behind the large model in the first place.
+
+# Routing policies:
+#   "small_only"   - always use phi3:mini
+#   "auto"         - use phi3:mini unless the prompt won't fit its context window
+#   "prefer_large" - use qwen3:14b unless the service is busy or the caller's SLO rules it out
+DEFAULT_POLICY = "auto"
+ENDPOINT_POLICIES = {
+    "/api/screenplay": "prefer_large",
+}
+
+# Routing decisions and per-model latency stats
+routing_log = deque(maxlen=200)
+model_stats = {}
+unavailable_models = set()
+
+# rag_service handles one query at a time, so the load signal is its backlog:
+# the lines still waiting on stdin when a query is routed.
+
+def get_policy(endpoint):
+    """Returns the routing policy for an endpoint."""
+    return ENDPOINT_POLICIES.get(endpoint, DEFAULT_POLICY)
+
+def estimate_prompt_tokens(question, model):
+    """Estimates the prompt size for a question once retrieved chunks are added."""
+    return count_tokens_rough(question) + model["chunks"] * CHUNK_TOKENS + TEMPLATE_TOKENS
+
+def fits_context(question, model):
+    """Checks whether the prompt leaves enough of the model's context window for an answer."""
+    return estimate_prompt_tokens(question, model) <= model["context_window"] - ANSWER_TOKEN_RESERVE
+
+def _get_stats(model_name):
+    if model_name not in model_stats:
+        model_stats[model_name] = {
+            "requests": 0,
+            "errors": 0,
+            "latencies_ms": deque(maxlen=LATENCY_SAMPLES),
+        }
+    return model_stats[model_name]
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def estimate_latency_ms(model_name, pct=0.95):
+    """Returns a percentile of recent latencies for a model, or a default until there are enough samples."""
+    samples = _get_stats(model_name)["latencies_ms"]
+    if len(samples) < 5:
+        return DEFAULT_LATENCY_MS[model_name]
+    return _percentile(samples, pct)
+
+def get_latency_budget_ms(latency_slo_ms=None, waited_ms=0):
+    """Returns the time left for a request: the caller's SLO, capped at the app.js
+    request timeout, minus the time it already spent waiting in the queue."""
+    if latency_slo_ms is None:
+        budget_ms = REQUEST_TIMEOUT_MS
+    else:
+        budget_ms = min(latency_slo_ms, REQUEST_TIMEOUT_MS)
+    return budget_ms - waited_ms
+
+def mark_unavailable(model_name):
+    """Stops routing to a model, e.g. when it isn't installed in Ollama."""
+    unavailable_models.add(model_name)
+    print(f"{model_name} is unavailable, routing everything to {SMALL_MODEL['name']}", file=sys.stderr)
+
+def is_available(model):
+    """Checks whether a model can be routed to."""
+    return model["name"] not in unavailable_models
+
+def choose_model(endpoint, question, backlog=0, latency_slo_ms=None, waited_ms=0):
+    """Picks a model for a request.
+
+    Returns (model, reason, deadline), where deadline is the time (as time.time())
+    by which the answer is due.
+    """
+    policy = get_policy(endpoint)
+    budget_ms = get_latency_budget_ms(latency_slo_ms, waited_ms)
+
+    # What the endpoint's policy and the prompt size ask for
+    if policy == "small_only":
+        model, reason = SMALL_MODEL, "policy"
+    elif policy == "prefer_large":
+        model, reason = LARGE_MODEL, "policy"
+    elif not fits_context(question, SMALL_MODEL):
+        model, reason = LARGE_MODEL, "prompt_size"
+    else:
+        model, reason = SMALL_MODEL, "default"
+
+    # Overrides that only matter when qwen3:14b was picked
+    if model is LARGE_MODEL:
+        if not is_available(LARGE_MODEL):
+            model, reason = SMALL_MODEL, "unavailable"
+        elif backlog > MAX_QUEUE_FOR_LARGE:
+            model, reason = SMALL_MODEL, "load"
+        elif estimate_latency_ms(LARGE_MODEL["name"]) >= budget_ms:
+            if estimate_latency_ms(SMALL_MODEL["name"]) >= budget_ms:
+                model, reason = SMALL_MODEL, "slo_best_effort"
+            else:
+                model, reason = SMALL_MODEL, "slo"
+
+    deadline = time.time() + budget_ms / 1000
+    routing_log.append({
+        "time": time.time(),
+        "endpoint": endpoint,
+        "policy": policy,
+        "model": model["name"],
+        "reason": reason,
+        "prompt_tokens": estimate_prompt_tokens(question, model),
+        "backlog": backlog,
+        "waited_ms": waited_ms,
+        "latency_slo_ms": latency_slo_ms,
+    })
+    print(
+        f"Routing {endpoint} to {model['name']} "
+        f"(policy: {policy}, reason: {reason}, backlog: {backlog}, waited: {waited_ms:.0f} ms)",
+        file=sys.stderr
+    )
+    return model, reason, deadline
+
+def has_time_for(model, deadline):
+    """Checks whether a typical request to the model would finish before the deadline."""
+    return (deadline - time.time()) * 1000 >= estimate_latency_ms(model["name"], 0.5)
+
+def record_latency(model_name, elapsed_ms, error=False):
+    """Records the outcome of a request served by a model."""
+    stats = _get_stats(model_name)
+    stats["requests"] += 1
+    if error:
+        stats["errors"] += 1
+    else:
+        stats["latencies_ms"].append(elapsed_ms)
+
+def get_routing_stats():
+    """Summarizes per-model latency and recent routing decisions."""
+    models = {}
+    for model_name, stats in model_stats.items():
+        samples = stats["latencies_ms"]
+        models[model_name] = {
+            "requests": stats["requests"],
+            "errors": stats["errors"],
+            "p50_ms": _percentile(samples, 0.5) if samples else None,
+            "p95_ms": _percentile(samples, 0.95) if samples else None,
+        }
+    reasons = {}
+    for decision in routing_log:
+        key = f"{decision['model']}:{decision['reason']}"
+        reasons[key] = reasons.get(key, 0) + 1
+    return {"models": models, "decisions": reasons, "unavailable": sorted(unavailable_models)}
@@ -1,6 +1,10 @@
 # rag_local.py
 import os
 import glob
+import re
+import random
+import hashlib
+from collections import defaultdict
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader # Or UnstructuredPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -22,6 +26,14 @@ set_llm_cache(InMemoryCache())
 
 CHROMA_PATH = "chroma_db" # Directory to store ChromaDB data
 
+# Near-duplicate detection settings (MinHash/LSH)
+DEDUP_THRESHOLD = 0.85  # Estimated Jaccard similarity at which a chunk counts as a duplicate
+DEDUP_NUM_PERM = 64     # Number of MinHash permutations per chunk
+DEDUP_BANDS = 16        # LSH bands (DEDUP_NUM_PERM must be divisible by this)
+DEDUP_SHINGLE_SIZE = 5  # Words per shingle
+EMBEDDING_DIMENSIONS = 768  # nomic-embed-text vector size, used to estimate index savings
+_MERSENNE_PRIME = (1 << 61) - 1
+
 load_dotenv() # Optional: Loads environment variables from.env file
 
 DATA_PATH = "data/"
@@ -64,6 +76,134 @@ def split_documents(documents):
     print(f"Split into {len(all_splits)} chunks")
     return all_splits
 
+def _normalize_text(text):
+    """Lowercases text and collapses whitespace so formatting differences don't hide duplicates."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def _shingles(text, shingle_size=DEDUP_SHINGLE_SIZE):
+    """Returns the set of hashed word shingles for a normalized chunk of text."""
+    words = text.split()
+    if len(words) <= shingle_size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams}
+
+def _minhash_signature(shingles, permutations):
+    """Computes a MinHash signature for a set of shingle hashes."""
+    return tuple(
+        min((a * s + b) % _MERSENNE_PRIME for s in shingles)
+        for a, b in permutations
+    )
+
+def _source_reference(chunk):
+    """Builds a short 'source:page' reference for a chunk from its metadata."""
+    source = chunk.metadata.get("source", "unknown")
+    page = chunk.metadata.get("page")
+    return f"{source}:{page}" if page is not None else str(source)
+
+def deduplicate_chunks(chunks, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS):
+    """Removes exact and near-duplicate chunks before they are embedded.
+
+    Exact duplicates are caught by hashing the normalized text. Near duplicates
+    (repeated choruses, boilerplate pages) are found with MinHash/LSH and kept
+    only if their estimated Jaccard similarity to an earlier chunk is below
+    `threshold`. The first occurrence is kept and the sources of the dropped
+    chunks are recorded on it in the `duplicate_sources` metadata field.
+    Chunks with no words in them (blank or punctuation-only) are dropped.
+
+    Returns a tuple of (unique_chunks, stats).
+    """
+    stats = {
+        "input_chunks": len(chunks),
+        "unique_chunks": 0,
+        "exact_duplicates": 0,
+        "near_duplicates": 0,
+        "empty_chunks": 0,
+        "characters_skipped": 0,
+        "index_bytes_saved": 0,
+    }
+    if not chunks:
+        print("No chunks to deduplicate")
+        return [], stats
+    if num_perm % bands != 0:
+        raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+
+    rows = num_perm // bands
+    rng = random.Random(1)  # Fixed seed so signatures are stable between runs
+    permutations = [
+        (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+        for _ in range(num_perm)
+    ]
+
+    unique_chunks = []
+    signatures = []
+    back_references = []
+    exact_index = {}
+    band_buckets = defaultdict(list)
+
+    for chunk in chunks:
+        normalized = _normalize_text(chunk.page_content)
+        if not normalized:
+            # Nothing to retrieve in a blank or punctuation-only chunk
+            stats["empty_chunks"] += 1
+            stats["characters_skipped"] += len(chunk.page_content)
+            continue
+
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+        match = exact_index.get(digest)
+        if match is not None:
+            stats["exact_duplicates"] += 1
+        else:
+            signature = _minhash_signature(_shingles(normalized), permutations)
+            band_keys = [(i, signature[i * rows:(i + 1) * rows]) for i in range(bands)]
+            candidates = {idx for key in band_keys for idx in band_buckets[key]}
+            for idx in sorted(candidates):
+                similarity = sum(x == y for x, y in zip(signature, signatures[idx])) / num_perm
+                if similarity >= threshold:
+                    match = idx
+                    stats["near_duplicates"] += 1
+                    break
+
+        if match is not None:
+            back_references[match].append(_source_reference(chunk))
+            stats["characters_skipped"] += len(chunk.page_content)
+            continue
+
+        idx = len(unique_chunks)
+        exact_index[digest] = idx
+        for key in band_keys:
+            band_buckets[key].append(idx)
+        unique_chunks.append(chunk)
+        signatures.append(signature)
+        back_references.append([])
+
+    # Chroma metadata only accepts scalar values, so back-references are stored as a string
+    for chunk, refs in zip(unique_chunks, back_references):
+        if refs:
+            chunk.metadata["duplicate_count"] = len(refs)
+            chunk.metadata["duplicate_sources"] = "; ".join(refs)
+
+    removed = len(chunks) - len(unique_chunks)
+    total_characters = sum(len(c.page_content) for c in chunks)
+    stats["unique_chunks"] = len(unique_chunks)
+    stats["index_bytes_saved"] = removed * EMBEDDING_DIMENSIONS * 4  # float32 vectors
+
+    print(
+        f"Deduplicated {len(chunks)} chunks -> {len(unique_chunks)} "
+        f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near duplicates, "
+        f"{stats['empty_chunks']} empty)"
+    )
+    if removed:
+        skipped_share = stats["characters_skipped"] / total_characters if total_characters else 0
+        print(
+            f"Skipped embedding {removed} chunk(s) / {stats['characters_skipped']} of "
+            f"{total_characters} characters ({skipped_share:.1%}), "
+            f"saving ~{stats['index_bytes_saved'] / 1024:.1f} KiB of vector index"
+        )
+    return unique_chunks, stats
+
 def get_embedding_function(model_name="nomic-embed-text"):
     """Initializes the Ollama embedding function."""
     # Ensure Ollama server is running (ollama serve)
@@ -121,14 +261,15 @@ def index_documents(chunks, embedding_function, persist_directory=CHROMA_PATH):
     print(f"Indexing complete. Data saved to: {persist_directory}")
     return vectorstore
 
-def create_rag_chain(vector_store, llm_model_name="qwen3:14b", context_window=16384):
+def create_rag_chain(vector_store, llm_model_name="qwen3:14b", context_window=16384, reasoning=None):
     """Creates the RAG chain."""
     # Initialize the LLM
     llm = ChatOllama(
         model=llm_model_name,
         temperature=0, # Lower temperature for more factual RAG answers 
         # you might want to experiment with other parameters (e.g., top_p, top_k) to optimize the behavior of the larger model.
-        num_ctx=context_window # IMPORTANT: Set context window size
+        num_ctx=context_window, # IMPORTANT: Set context window size
+        reasoning=reasoning # False keeps thinking models (qwen3) from putting <think> blocks in the answer
     )
     print(f"Initialized ChatOllama with model: {llm_model_name}, context window: {context_window}")
 
@@ -239,6 +380,8 @@ if __name__ == "__main__":
     docs = load_documents()
     # 2. Split Documents
     chunks = split_documents(docs)
+    # 2b. Drop exact and near-duplicate chunks before embedding
+    chunks, _ = deduplicate_chunks(chunks)
     # 3. Get Embedding Function
     embedding_function = get_embedding_function() # Using Ollama nomic-embed-text
     # 4. Index Documents (Only needs to be done once per document set)
@@ -3,20 +3,30 @@
 RAG service module - Exposes RAG functionality for Node.js Express API
 """
 import os
+import sys
+import time
+import json
 import asyncio
 import glob
+import queue
+import threading
+import urllib.request
 from rag_local import (
     get_embedding_function, 
     get_vector_store,
     split_documents,
+    deduplicate_chunks,
+    create_rag_chain,
     create_optimized_rag_chain,
     query_rag_async
 )
+import model_router
 from langchain_community.document_loaders import PyPDFLoader
 
 # Store vector stores and RAG chains by endpoint
 vector_stores = {}
-rag_chains = {}
+rag_chains = {}        # phi3:mini chains
+large_rag_chains = {}  # qwen3:14b chains
 endpoint_pdf_dirs = {}
 
 # Initialize embedding function once
@@ -26,6 +36,23 @@ embedding_function = get_embedding_function(model_name="nomic-embed-text")
 # Default data directory (for backward compatibility)
 DEFAULT_DATA_DIR = "data"
 
+def is_model_installed(model_name):
+    """Checks whether a model has been pulled into the local Ollama server."""
+    host = os.environ.get("OLLAMA_HOST", "localhost:11434")
+    if not host.startswith("http"):
+        host = f"http://{host}"
+    try:
+        with urllib.request.urlopen(f"{host}/api/tags", timeout=5) as response:
+            installed = {model["name"] for model in json.load(response).get("models", [])}
+    except Exception as e:
+        # Don't disable the model just because the check itself failed
+        print(f"Could not list Ollama models: {e}", file=sys.stderr)
+        return True
+    return model_name in installed or f"{model_name}:latest" in installed
+
+if not is_model_installed(model_router.LARGE_MODEL["name"]):
+    model_router.mark_unavailable(model_router.LARGE_MODEL["name"])
+
 def load_documents_for_endpoint(pdf_dir):
     """Loads all PDF documents from the specified PDF directory."""
     documents = []
@@ -57,6 +84,7 @@ def initialize_endpoint_vector_store(endpoint, pdf_dir):
     # Load and index documents
     documents = load_documents_for_endpoint(pdf_dir)
     chunks = split_documents(documents)
+    chunks, _ = deduplicate_chunks(chunks)
     
     if not chunks:
         print(f"No documents to index for {endpoint}")
@@ -73,12 +101,19 @@ def initialize_endpoint_vector_store(endpoint, pdf_dir):
         )
         vector_store.persist()
     
-    # Create RAG chain for this endpoint
+    # Create both RAG chains for this endpoint; the model router picks one per request
     rag_chain = create_optimized_rag_chain(
         vector_store, 
-        llm_model_name="phi3:mini", 
-        context_window=4096
+        llm_model_name=model_router.SMALL_MODEL["name"], 
+        context_window=model_router.SMALL_MODEL["context_window"]
     )
+    if model_router.is_available(model_router.LARGE_MODEL):
+        large_rag_chains[endpoint] = create_rag_chain(
+            vector_store,
+            llm_model_name=model_router.LARGE_MODEL["name"],
+            context_window=model_router.LARGE_MODEL["context_window"],
+            reasoning=False
+        )
     
     # Store in dictionaries
     vector_stores[endpoint] = vector_store
@@ -99,47 +134,108 @@ else:
 
 print("RAG pipeline ready to serve requests!", flush=True)
 
-async def process_query(endpoint, question):
+async def run_routed_query(endpoint, question, backlog=0, latency_slo_ms=None, waited_ms=0):
+    """Routes a query to the small or large chain and records its latency.
+
+    Falls back to the small chain if the large one fails and there is still
+    time for it before the deadline.
+    """
+    model, reason, deadline = model_router.choose_model(
+        endpoint, question, backlog, latency_slo_ms, waited_ms
+    )
+    small_model = model_router.SMALL_MODEL
+    chains = large_rag_chains if model is model_router.LARGE_MODEL else rag_chains
+
+    start_time = time.time()
+    try:
+        response = await query_rag_async(chains[endpoint], question)
+        model_router.record_latency(model["name"], (time.time() - start_time) * 1000)
+        return response
+    except Exception as e:
+        model_router.record_latency(model["name"], (time.time() - start_time) * 1000, error=True)
+        if model is small_model:
+            raise
+        if not model_router.has_time_for(small_model, deadline):
+            print(f"{model['name']} failed for {endpoint} ({e}), no time left to retry", file=sys.stderr)
+            raise
+        print(f"{model['name']} failed for {endpoint} ({e}), falling back to {small_model['name']}", file=sys.stderr)
+
+    start_time = time.time()
+    try:
+        response = await query_rag_async(rag_chains[endpoint], question)
+    except Exception:
+        model_router.record_latency(small_model["name"], (time.time() - start_time) * 1000, error=True)
+        raise
+    model_router.record_latency(small_model["name"], (time.time() - start_time) * 1000)
+    return response
+
+async def process_query(endpoint, question, backlog=0, latency_slo_ms=None, waited_ms=0):
     """Process a single query using the appropriate endpoint's RAG chain"""
     try:
-        # Use the specific endpoint's RAG chain if available, otherwise use default
-        if endpoint in rag_chains:
-            chain = rag_chains[endpoint]
-        else:
+        # Use the specific endpoint's RAG chains if available, otherwise use default
+        if endpoint not in rag_chains:
             print(f"No RAG chain for endpoint {endpoint}, using default")
-            chain = rag_chains.get("/api/query")
+            endpoint = "/api/query"
             
             # If even default is not available, create it
-            if not chain:
+            if endpoint not in rag_chains:
                 print("Default RAG chain not found, creating it")
                 default_pdf_dir = os.path.join(DEFAULT_DATA_DIR, "general/pdfs")
                 os.makedirs(default_pdf_dir, exist_ok=True)
-                _, chain = initialize_endpoint_vector_store("/api/query", default_pdf_dir)
+                initialize_endpoint_vector_store(endpoint, default_pdf_dir)
         
-        if chain:
-            response = await query_rag_async(chain, question)
+        if endpoint in rag_chains:
+            response = await run_routed_query(endpoint, question, backlog, latency_slo_ms, waited_ms)
             return response
         else:
             return "Error: No RAG chain available to process your query"
     except Exception as e:
         return f"Error: {str(e)}"
 
+def parse_query_options(options):
+    """Parses routing hints sent with a query (format: "sent=epochMs,slo=1500").
+
+    Returns (latency_slo_ms, waited_ms), where waited_ms is how long ago app.js
+    sent the query.
+    """
+    latency_slo_ms = None
+    waited_ms = 0
+    for option in options.split(","):
+        key, _, value = option.partition("=")
+        try:
+            if key == "slo":
+                latency_slo_ms = float(value)
+            elif key == "sent":
+                waited_ms = max(0, time.time() * 1000 - float(value))
+        except ValueError:
+            print(f"Ignoring invalid query option: {option}", file=sys.stderr)
+    return latency_slo_ms, waited_ms
+
 # Helper to run async functions from sync code
-def run_query(endpoint, question):
-    return asyncio.run(process_query(endpoint, question))
+def run_query(endpoint, question, backlog=0, latency_slo_ms=None, waited_ms=0):
+    return asyncio.run(process_query(endpoint, question, backlog, latency_slo_ms, waited_ms))
+
+def read_stdin(lines):
+    """Reads stdin on a background thread so the backlog can be measured with qsize()."""
+    for line in sys.stdin:
+        lines.put(line)
+    lines.put(None)  # End of input
 
 if __name__ == "__main__":
     # Run as a service that processes commands from stdin
-    import sys
     
     print("RAG service is running and ready to process queries...", flush=True)
     
     # Create event loop for async operations
     loop = asyncio.get_event_loop()
     
+    # Commands waiting to be processed
+    pending_lines = queue.Queue()
+    threading.Thread(target=read_stdin, args=(pending_lines,), daemon=True).start()
+    
     try:
         # Process input lines as they come in
-        for line in sys.stdin:
+        for line in iter(pending_lines.get, None):
             line = line.strip()
             
             # Command format: "QUERY:requestId:question"
@@ -148,15 +244,23 @@ if __name__ == "__main__":
                 if len(parts) == 3:
                     command, request_id, question = parts
                     
-                    # Extract endpoint from requestId if it includes it (format: endpoint|uniqueId)
+                    # Extract endpoint and optional routing hints from requestId
+                    # (format: endpoint|uniqueId or endpoint|uniqueId|sent=epochMs,slo=ms)
+                    latency_slo_ms, waited_ms = None, 0
                     if "|" in request_id:
                         endpoint, unique_id = request_id.split("|", 1)
+                        if "|" in unique_id:
+                            unique_id, options = unique_id.split("|", 1)
+                            latency_slo_ms, waited_ms = parse_query_options(options)
                         request_id = unique_id  # Use only the unique part for the response
                     else:
                         endpoint = "/api/query"  # Default endpoint
                     
                     # Process the query asynchronously
-                    response = loop.run_until_complete(process_query(endpoint, question))
+                    # Everything still unread is waiting behind this query
+                    response = loop.run_until_complete(
+                        process_query(endpoint, question, pending_lines.qsize(), latency_slo_ms, waited_ms)
+                    )
                     
                     # Send the response back with the request ID
                     # Format: "RESPONSE:requestId:result"
@@ -182,6 +286,12 @@ if __name__ == "__main__":
                     print(f"Initialization complete for {endpoint}")
                     sys.stdout.flush()
             
+            # Command format: "STATS:"
+            elif line.startswith("STATS:"):
+                # Response format: "STATS:json"
+                print(f"STATS:{json.dumps(model_router.get_routing_stats())}")
+                sys.stdout.flush()
+            
     except KeyboardInterrupt:
         print("RAG service shutting down...")
     finally:
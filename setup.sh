@@ -22,6 +22,7 @@ fi
 # Pull required models
 echo "Pulling required models (if needed)..."
 ollama pull phi3:mini
+ollama pull qwen3:14b
 ollama pull nomic-embed-text
 
 # Ask if the user wants to initialize the database